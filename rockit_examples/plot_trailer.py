@@ -55,17 +55,23 @@ def vert_single(x, y, theta, dx, dy):
 	points = homog_transf_matrix.dot(vertices)[:2].transpose()
 	return points
 
-def wheel_to_plot(ax, x, y, theta, dx, dy, delta=0, color='k'):
+def wheel_xy(x, y, theta, dx, dy, delta=0):
 	steering_wheel_pos = vert_single(x, y, theta, dx, dy)
 	steering_wheel = vert_vehic(steering_wheel_pos[0][0], steering_wheel_pos[0][1], theta+delta, .01, .01, .1, .1)
 	steering_wheel_ext = np.append(steering_wheel, [[steering_wheel[0][0], steering_wheel[0][1]]], axis=0)
-	wheel = ax.plot([x[0] for x in steering_wheel_ext], [y[1] for y in steering_wheel_ext], color=color)
-	return wheel
+	return steering_wheel_ext[:, 0], steering_wheel_ext[:, 1]
 
-def vehic_to_plot(ax, x, y, theta, w_left, w_right, l_front, l_back, color='b'):
+def vehic_xy(x, y, theta, w_left, w_right, l_front, l_back):
 	vertices_veh = vert_vehic(x, y, theta, w_left, w_right, l_front, l_back)
 	vertices_veh_ext = np.append(vertices_veh, [[vertices_veh[0][0], vertices_veh[0][1]]], axis=0)
-	veh = ax.plot([x[0] for x in vertices_veh_ext], [y[1] for y in vertices_veh_ext], color=color)
+	return vertices_veh_ext[:, 0], vertices_veh_ext[:, 1]
+
+def wheel_to_plot(ax, x, y, theta, dx, dy, delta=0, color='k'):
+	wheel = ax.plot(*wheel_xy(x, y, theta, dx, dy, delta), color=color)
+	return wheel
+
+def vehic_to_plot(ax, x, y, theta, w_left, w_right, l_front, l_back, color='b'):
+	veh = ax.plot(*vehic_xy(x, y, theta, w_left, w_right, l_front, l_back), color=color)
 	return veh
 
 def line_points(a=0, b=0, c=0, ref=[-1., 1.]):
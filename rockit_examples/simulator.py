@@ -37,7 +37,7 @@ def simulator_delta_init():
     ocp.set_der(y1,     v1*sin(theta1))
     ocp.set_der(theta0, dtheta0)
 
-    ocp.method(MultipleShooting(N=1, M=4, intg='rk'))
+    ocp.method(MultipleShooting(N=1, M=4, intg='rk', expand=True))
 
     ocp.solver('ipopt')
 
@@ -79,7 +79,7 @@ def simulator_omega_init():
     ocp.set_der(y1,     v1*sin(theta1))
     ocp.set_der(theta0, dtheta0)
 
-    ocp.method(MultipleShooting(N=1, M=4, intg='rk'))
+    ocp.method(MultipleShooting(N=1, M=4, intg='rk', expand=True))
 
     ocp.solver('ipopt')
 
@@ -30,43 +30,56 @@ Simple motion planning for vehicle with trailer
 from rockit import *
 import matplotlib.pyplot as plt
 import numpy as np
-from numpy import pi, cos, sin, tan
-from casadi import vertcat, horzcat
+from casadi import vertcat, horzcat, vec
+import casadi as c
 from plot_trailer import *
 from simulator import *
 import yaml
+import os
+import subprocess
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+pi = np.pi
 
 show_figures = True
 use_simulator = False
 save_for_gif = False
+use_jit = False
+use_jit_nlp = False
+use_codegen = False
+use_serialized = False
+resolve_warm = False
+linear_solver = "ma57"  # linear solver of IPOPT, e.g. "ma57", "ma97" or "mumps"
 
 refine = 2
 Ts = 0.1
 
 # Environment
 og = 0*pi/180
-sg = sin(og)
-cg = cos(og)
+sg = np.sin(og)
+cg = np.cos(og)
 
 xcr = 0.5
 ycr = 2.
-pcr = vertcat(xcr, ycr)
+pcr = np.array([xcr, ycr])
 
 xcl = -0.5
 ycl = 2.4
-pcl = vertcat(xcl, ycl)
+pcl = np.array([xcl, ycl])
 
-n1_1 = vertcat(-cg, sg)
-w1_1 = vertcat(n1_1, -n1_1.T @ pcl)
+# Half-plane constraints w.T @ [x, y, 1] <= 0, numerical constants
+n1_1 = np.array([-cg, sg])
+w1_1 = np.append(n1_1, -n1_1 @ pcl)
 
 n2_1 = -n1_1
-w2_1 = vertcat(n2_1, -n2_1.T @ pcr)
+w2_1 = np.append(n2_1, -n2_1 @ pcr)
 
-n1_2 = vertcat(sg, cg)
-w1_2 = vertcat(n1_2, -n1_2.T @ pcl)
+n1_2 = np.array([sg, cg])
+w1_2 = np.append(n1_2, -n1_2 @ pcl)
 
 n2_2 = -n1_2
-w2_2 = vertcat(n2_2, -n2_2.T @ pcr)
+w2_2 = np.append(n2_2, -n2_2 @ pcr)
 
 # Parameters
 with open('truck_trailer_para.yaml', 'r') as file:
@@ -98,21 +111,27 @@ def create_stage(ocp, t0, T, N, M, w):
 	y1     = stage.state()
 
 	theta0 = stage.state()
-	x0     = x1 + L1*cos(theta1) + M0*cos(theta0)
-	y0     = y1 + L1*sin(theta1) + M0*sin(theta0)
+
+	# Trigonometric subexpressions, shared by all expressions below
+	c0, s0 = c.cos(theta0), c.sin(theta0)
+	c1, s1 = c.cos(theta1), c.sin(theta1)
+
+	x0     = x1 + L1*c1 + M0*c0
+	y0     = y1 + L1*s1 + M0*s0
 
 	delta0 = stage.control(order=1)
 	v0     = stage.control(order=1)
 
 	beta01 = theta0 - theta1
+	cb, sb = c.cos(beta01), c.sin(beta01)
 
-	dtheta0 = v0/L0*tan(delta0)
-	dtheta1 = v0/L1*sin(beta01) - M0/L1*cos(beta01)*dtheta0
-	v1 = v0*cos(beta01) + M0*sin(beta01)*dtheta0
+	dtheta0 = v0/L0*c.tan(delta0)
+	dtheta1 = v0/L1*sb - M0/L1*cb*dtheta0
+	v1 = v0*cb + M0*sb*dtheta0
 
 	stage.set_der(theta1, dtheta1)
-	stage.set_der(x1,     v1*cos(theta1))
-	stage.set_der(y1,     v1*sin(theta1))
+	stage.set_der(x1,     v1*c1)
+	stage.set_der(y1,     v1*s1)
 
 	stage.set_der(theta0, dtheta0)
 
@@ -125,17 +144,15 @@ def create_stage(ocp, t0, T, N, M, w):
 
 	stage.subject_to(-pi/2 <= (beta01 <= pi/2))
 
-	stage.method(MultipleShooting(N=N, M=M, intg='rk'))
+	stage.method(MultipleShooting(N=N, M=M, intg='rk', expand=True))
 
-	# Room constraint
+	# Room constraint, all vertices in homogeneous coordinates at once
 	veh_vertices = vert_vehic(x0, y0, theta0, W0/2, W0/2, L0, M0)
-	for veh_vertex in veh_vertices:
-		phom = vertcat(veh_vertex[0], veh_vertex[1], 1)
-		stage.subject_to(w.T @ phom <= 0)
+	phom = horzcat(*[vertcat(veh_vertex[0], veh_vertex[1], 1) for veh_vertex in veh_vertices])
+	stage.subject_to(vec(w.T @ phom) <= 0)
 	veh_vertices = vert_vehic(x1, y1, theta1, W1/2, W1/2, L1, M1)
-	for veh_vertex in veh_vertices:
-		phom = vertcat(veh_vertex[0], veh_vertex[1], 1)
-		stage.subject_to(w.T @ phom <= 0)
+	phom = horzcat(*[vertcat(veh_vertex[0], veh_vertex[1], 1) for veh_vertex in veh_vertices])
+	stage.subject_to(vec(w.T @ phom) <= 0)
 	
 	# Minimal time
 	stage.add_objective(stage.T)
@@ -149,9 +166,7 @@ def stitch_stages(ocp, stage1, stage2):
 	for i in range(len(stage1.states)):
 		ocp.subject_to(stage2.at_t0(stage2.states[i]) == stage1.at_tf(stage1.states[i]))
 
-ocp = Ocp()
-
-# Stage 1 - Approach
+# Number of control intervals, integration steps and initial time guesses
 N_1 = 10
 M_1 = 2
 T_1 = 10.
@@ -162,150 +177,260 @@ N_3 = 10
 M_3 = 2
 T_3 = 10.
 
-stage_1, theta1_1, x1_1, y1_1, theta0_1, x0_1, y0_1, delta0_1, v0_1 = \
-		create_stage(ocp, FreeTime(0), FreeTime(T_1), N_1, M_1, horzcat(w1_1, w2_1, w1_2))
-
-# Initial constraints
-ocp.subject_to(stage_1.t0 == 0)
-ocp.subject_to(stage_1.at_t0(x1_1) == x1_t0)
-ocp.subject_to(stage_1.at_t0(y1_1) == y1_t0)
-ocp.subject_to(stage_1.at_t0(theta1_1) == theta1_t0)
-ocp.subject_to(stage_1.at_t0(theta0_1) == theta0_t0)
-
-# Stage 2 - Corner
-stage_2, theta1_2, x1_2, y1_2, theta0_2, x0_2, y0_2, delta0_2, v0_2 = \
-		create_stage(ocp, FreeTime(T_1), FreeTime(T_2), N_2, M_2, horzcat(w1_2, w2_2, w1_1))
-stitch_stages(ocp, stage_1, stage_2)
-
-# Final constraint
-ocp.subject_to(stage_2.at_tf(x1_2) == x1_tf)
-ocp.subject_to(stage_2.at_tf(y1_2) == y1_tf)
-ocp.subject_to(stage_2.at_tf(theta1_2) == theta1_tf)
-ocp.subject_to(stage_2.at_tf(theta0_2) == theta0_tf)
+# Initial guess, linear between the initial and final pose: up the corridor
+# in stage 1, around the corner in stage 2
+y1_guess_1     = np.linspace(y1_t0, y1_tf, N_1+1)
+theta1_guess_2 = np.linspace(theta1_t0, theta1_tf, N_2+1)
+x1_guess_2     = np.linspace(x1_t0, x1_tf, N_2+1)
+theta0_guess_2 = np.linspace(theta0_t0, theta0_tf, N_2+1)
+
+# Just-in-time compile the generated C code of the CasADi functions: either
+# solve_ocp as a whole (use_jit) or only the NLP functions evaluated by the
+# solver (use_jit_nlp). Only pays off when the functions are evaluated many
+# times since compilation takes several seconds. -O3 triples compilation time
+# of the NLP functions without faster evaluation. The functions are compiled
+# again on every run; only use_codegen keeps compiled code across runs.
+casadi_path = c.GlobalOptions.getCasadiPath()
+jit_opts = {"jit": True,
+			"compiler": "shell",
+			"jit_options": {"flags": ['-O1', '-I' + c.GlobalOptions.getCasadiIncludePath()],
+							"linker_flags": ['-L' + casadi_path, '-Wl,-rpath,' + casadi_path,
+											 '-lipopt'],
+							"verbose": False}}
 
 # Pick a solution method
 options = { "expand": True,
 			"verbose": False,
 			"print_time": True,
-			"error_on_fail": True,
-			"ipopt": {	"linear_solver": "ma57",
-						"tol": 1e-8}}
-ocp.solver('ipopt', options)
-
-# Make it concrete for this ocp
-
-theta1_1s = stage_1.sample(theta1_1, grid='control')[1]
-x1_1s     = stage_1.sample(x1_1, 	 grid='control')[1]
-y1_1s     = stage_1.sample(y1_1, 	 grid='control')[1]
-theta0_1s = stage_1.sample(theta0_1, grid='control')[1]
-delta0_1s = stage_1.sample(delta0_1, grid='control')[1]
-v0_1s     = stage_1.sample(v0_1, 	 grid='control')[1]
-
-theta1_2s = stage_2.sample(theta1_2, grid='control')[1]
-x1_2s     = stage_2.sample(x1_2, 	 grid='control')[1]
-y1_2s     = stage_2.sample(y1_2, 	 grid='control')[1]
-theta0_2s = stage_2.sample(theta0_2, grid='control')[1]
-delta0_2s = stage_2.sample(delta0_2, grid='control')[1]
-v0_2s     = stage_2.sample(v0_2, 	 grid='control')[1]
-
-sampler1  = stage_1.sampler([theta1_1, x1_1, y1_1, theta0_1, x0_1, y0_1, delta0_1, v0_1])
-sampler2  = stage_2.sampler([theta1_2, x1_2, y1_2, theta0_2, x0_2, y0_2, delta0_2, v0_2])
-
-t1 = ocp.value(stage_1.T)
-t2 = t1 + ocp.value(stage_2.T)
-
-solve_ocp = ocp.to_function('solve_ocp',
-							[ocp.value(stage_1.T), theta1_1s, x1_1s, y1_1s, theta0_1s, delta0_1s, v0_1s, \
-							 ocp.value(stage_2.T), theta1_2s, x1_2s, y1_2s, theta0_2s, delta0_2s, v0_2s], \
-							[t1, theta1_1s, x1_1s, y1_1s, theta0_1s, delta0_1s, v0_1s, \
-							 t2, theta1_2s, x1_2s, y1_2s, theta0_2s, delta0_2s, v0_2s, ocp.gist])
+			"error_on_fail": True}
+if use_jit_nlp and not use_jit:
+	# Objective, constraints, sparse constraint Jacobian and Lagrangian
+	# Hessian. With use_jit these are compiled as part of solve_ocp.
+	options.update(jit_opts)
+# MA97 factorizes in parallel (OpenMP), MUMPS is the fallback when
+# no HSL solvers are available. Other linear solvers run with IPOPT's
+# default options.
+linear_solver_options = {	"ma57": {},
+							"ma97": {	"ma97_order": "metis",
+										"ma97_nemin": 8},
+							"mumps": {	"mumps_mem_percent": 10000,
+										"mumps_permuting_scaling": 7}}
+options["ipopt"] = {	"linear_solver": linear_solver,
+						"tol": 1e-8,
+						**linear_solver_options.get(linear_solver, {})}
+
+# The problem dimensions are fixed, so the functions below can be generated
+# as C code and compiled into a shared library once. Later runs load them
+# from the library and skip the rockit/symbolic construction entirely.
+# Each solver gets a library of its own since the IPOPT support code can only
+# be generated once per file.
+# The libraries are named after a key of all settings they depend on, so
+# changing any of them builds new libraries instead of loading outdated ones.
+cache_key = hashlib.sha1(repr([c.__version__, para, options, use_jit,
+							   N_1, M_1, T_1, N_2, M_2, T_2,
+							   x1_t0, y1_t0, theta1_t0, theta0_t0,
+							   x1_tf, y1_tf, theta1_tf, theta0_tf,
+							   [w.tolist() for w in [w1_1, w2_1, w1_2, w2_2]]]).encode()).hexdigest()[:8]
+codegen_libs = {'solve_ocp_' + cache_key: ['solve_ocp', 'sampler1', 'sampler2']}
+if resolve_warm:
+	codegen_libs['solve_ocp_warm_' + cache_key] = ['solve_ocp_warm']
+
+# Without a compiler, the functions can be serialized to .casadi files
+# instead, named after the same key. They are rebuilt when a file is missing
+# or cannot be loaded.
+# Remove the libraries or .casadi files after changing the model itself
+# (create_stage, stitch_stages), which the key does not cover.
+# JIT-compiled functions are serialized together with their C code and
+# compiled again on every load, which takes longer than building them. They
+# are therefore not serialized with use_jit or use_jit_nlp; use_codegen keeps
+# the compiled functions across runs instead.
+if use_serialized and (use_jit or use_jit_nlp):
+	print('use_serialized is ignored with use_jit or use_jit_nlp')
+	use_serialized = False
+funcs = None
+if use_codegen and all(os.path.isfile(lib + '.so') for lib in codegen_libs):
+	funcs = {name: c.external(name, './' + lib + '.so')
+			 for lib, names in codegen_libs.items() for name in names}
+elif use_serialized:
+	try:
+		funcs = {name: c.Function.load(name + '_' + cache_key + '.casadi')
+				 for names in codegen_libs.values() for name in names}
+	except RuntimeError:
+		pass
+
+if funcs is not None:
+	solve_ocp = funcs['solve_ocp']
+	sampler1  = funcs['sampler1']
+	sampler2  = funcs['sampler2']
+	solve_ocp_warm = funcs.get('solve_ocp_warm')
+else:
+	ocp = Ocp()
+
+	# Stage 1 - Approach
+	stage_1, theta1_1, x1_1, y1_1, theta0_1, x0_1, y0_1, delta0_1, v0_1 = \
+			create_stage(ocp, FreeTime(0), FreeTime(T_1), N_1, M_1, horzcat(w1_1, w2_1, w1_2))
+
+	# Initial constraints
+	ocp.subject_to(stage_1.t0 == 0)
+	ocp.subject_to(stage_1.at_t0(x1_1) == x1_t0)
+	ocp.subject_to(stage_1.at_t0(y1_1) == y1_t0)
+	ocp.subject_to(stage_1.at_t0(theta1_1) == theta1_t0)
+	ocp.subject_to(stage_1.at_t0(theta0_1) == theta0_t0)
+
+	# Stage 2 - Corner
+	stage_2, theta1_2, x1_2, y1_2, theta0_2, x0_2, y0_2, delta0_2, v0_2 = \
+			create_stage(ocp, FreeTime(T_1), FreeTime(T_2), N_2, M_2, horzcat(w1_2, w2_2, w1_1))
+	stitch_stages(ocp, stage_1, stage_2)
+
+	# Final constraint
+	ocp.subject_to(stage_2.at_tf(x1_2) == x1_tf)
+	ocp.subject_to(stage_2.at_tf(y1_2) == y1_tf)
+	ocp.subject_to(stage_2.at_tf(theta1_2) == theta1_tf)
+	ocp.subject_to(stage_2.at_tf(theta0_2) == theta0_tf)
+
+	ocp.solver('ipopt', options)
+
+	# Make it concrete for this ocp
+
+	theta1_1s = stage_1.sample(theta1_1, grid='control')[1]
+	x1_1s     = stage_1.sample(x1_1, 	 grid='control')[1]
+	y1_1s     = stage_1.sample(y1_1, 	 grid='control')[1]
+	theta0_1s = stage_1.sample(theta0_1, grid='control')[1]
+	delta0_1s = stage_1.sample(delta0_1, grid='control')[1]
+	v0_1s     = stage_1.sample(v0_1, 	 grid='control')[1]
+
+	theta1_2s = stage_2.sample(theta1_2, grid='control')[1]
+	x1_2s     = stage_2.sample(x1_2, 	 grid='control')[1]
+	y1_2s     = stage_2.sample(y1_2, 	 grid='control')[1]
+	theta0_2s = stage_2.sample(theta0_2, grid='control')[1]
+	delta0_2s = stage_2.sample(delta0_2, grid='control')[1]
+	v0_2s     = stage_2.sample(v0_2, 	 grid='control')[1]
+
+	sampler1  = stage_1.sampler('sampler1', [theta1_1, x1_1, y1_1, theta0_1, x0_1, y0_1, delta0_1, v0_1])
+	sampler2  = stage_2.sampler('sampler2', [theta1_2, x1_2, y1_2, theta0_2, x0_2, y0_2, delta0_2, v0_2])
+
+	t1 = ocp.value(stage_1.T)
+	t2 = t1 + ocp.value(stage_2.T)
+
+	# Primal and dual variables of the NLP, used to warm start a next solve
+	opti = ocp._method.opti
+	solve_ocp_out = [t1, theta1_1s, x1_1s, y1_1s, theta0_1s, delta0_1s, v0_1s, \
+					 t2, theta1_2s, x1_2s, y1_2s, theta0_2s, delta0_2s, v0_2s, ocp.gist, \
+					 opti.x, opti.lam_g]
+
+	solve_ocp = ocp.to_function('solve_ocp',
+								[ocp.value(stage_1.T), theta1_1s, x1_1s, y1_1s, theta0_1s, delta0_1s, v0_1s, \
+								 ocp.value(stage_2.T), theta1_2s, x1_2s, y1_2s, theta0_2s, delta0_2s, v0_2s], \
+								solve_ocp_out, \
+								jit_opts if use_jit else {})
+
+	if resolve_warm:
+		# Warm started from a previous primal-dual solution, as done for
+		# successive MPC updates. The solver of the transcribed problem is
+		# reconfigured since rockit only applies ocp.solver() at transcription.
+		options["ipopt"].update({	"warm_start_init_point": "yes",
+									"mu_init": 1e-4,
+									"warm_start_bound_push": 1e-9,
+									"warm_start_mult_bound_push": 1e-9})
+		opti.solver('ipopt', options)
+		solve_ocp_warm = ocp.to_function('solve_ocp_warm', [opti.x, opti.lam_g], solve_ocp_out, \
+										 jit_opts if use_jit else {})
+
+	funcs = {func.name(): func for func in [solve_ocp, sampler1, sampler2] + \
+			 ([solve_ocp_warm] if resolve_warm else [])}
+	if use_codegen:
+		for lib, names in codegen_libs.items():
+			gen = c.CodeGenerator(lib + '.c', {"with_header": True})
+			for name in names:
+				gen.add(funcs[name])
+			gen.generate()
+			subprocess.run(['gcc', '-shared', '-fPIC'] + jit_opts["jit_options"]["flags"] + \
+						   [lib + '.c', '-o', lib + '.so'] + \
+						   jit_opts["jit_options"]["linker_flags"], check=True)
+	if use_serialized:
+		for name, func in funcs.items():
+			func.save(name + '_' + cache_key + '.casadi')
 
 # Solve func
 t1_sol, theta1_1sol, x1_1sol, y1_1sol, theta0_1sol, delta0_1sol, v0_1sol, \
-	t2_sol,	theta1_2sol, x1_2sol, y1_2sol, theta0_2sol, delta0_2sol, v0_2sol, gist_sol = \
-		 solve_ocp(T_1, theta1_t0,     x1_t0, np.linspace(y1_t0,y1_tf,N_1+1), theta0_t0,  							  0., .1,\
-			 	   T_2, np.linspace(theta1_t0,theta1_tf,N_2+1), x1_t0, y1_tf, np.linspace(theta0_t0,theta0_tf,N_2+1), 0., 0.)
+	t2_sol,	theta1_2sol, x1_2sol, y1_2sol, theta0_2sol, delta0_2sol, v0_2sol, gist_sol, \
+	x_sol, lam_g_sol = \
+		 solve_ocp(T_1, theta1_t0,      x1_t0, y1_guess_1, theta0_t0,      0., .1,\
+			 	   T_2, theta1_guess_2, x1_guess_2, y1_tf, theta0_guess_2, 0., 0.)
+
+if resolve_warm:
+	# Solve again, warm started from the previous primal-dual solution
+	t1_sol, theta1_1sol, x1_1sol, y1_1sol, theta0_1sol, delta0_1sol, v0_1sol, \
+		t2_sol,	theta1_2sol, x1_2sol, y1_2sol, theta0_2sol, delta0_2sol, v0_2sol, gist_sol, \
+		x_sol, lam_g_sol = solve_ocp_warm(x_sol, lam_g_sol)
 
 t1_ctrl = np.arange(0., t1_sol, Ts)
 t2_ctrl = np.arange(t1_sol, t2_sol, Ts)
-[theta1_1ctrl, x1_1ctrl, y1_1ctrl, theta0_1ctrl, x0_1ctrl, y0_1ctrl, delta0_1ctrl, v0_1ctrl] = sampler1(gist_sol, t1_ctrl)
-[theta1_2ctrl, x1_2ctrl, y1_2ctrl, theta0_2ctrl, x0_2ctrl, y0_2ctrl, delta0_2ctrl, v0_2ctrl] = sampler2(gist_sol, t2_ctrl)
-
-theta1_ctrl = np.concatenate([theta1_1ctrl, theta1_2ctrl])
-x1_ctrl     = np.concatenate([x1_1ctrl, x1_2ctrl])
-y1_ctrl     = np.concatenate([y1_1ctrl, y1_2ctrl])
-theta0_ctrl = np.concatenate([theta0_1ctrl, theta0_2ctrl])
-x0_ctrl     = np.concatenate([x0_1ctrl, x0_2ctrl])
-y0_ctrl     = np.concatenate([y0_1ctrl, y0_2ctrl])
-delta0_ctrl = np.concatenate([delta0_1ctrl, delta0_2ctrl])
-v0_ctrl     = np.concatenate([v0_1ctrl, v0_2ctrl])
-t_ctrl      = np.concatenate([t1_ctrl, t2_ctrl])
-
+n1_ctrl = len(t1_ctrl)
+
+# Sample both stages directly into one preallocated buffer, one row per signal
+sol_ctrl = np.empty((9, n1_ctrl + len(t2_ctrl)))
+# Evaluate the samplers at all time points in one call, spread over threads
+sol_ctrl[:8, :n1_ctrl] = vertcat(*sampler1.map(n1_ctrl, 'thread', os.cpu_count())(
+							gist_sol, t1_ctrl.reshape(1, -1))).full()
+sol_ctrl[:8, n1_ctrl:] = vertcat(*sampler2.map(len(t2_ctrl), 'thread', os.cpu_count())(
+							gist_sol, t2_ctrl.reshape(1, -1))).full()
+sol_ctrl[8, :n1_ctrl]  = t1_ctrl
+sol_ctrl[8, n1_ctrl:]  = t2_ctrl
+
+[theta1_ctrl, x1_ctrl, y1_ctrl, theta0_ctrl, x0_ctrl, y0_ctrl, delta0_ctrl, v0_ctrl, t_ctrl] = sol_ctrl
+
+# Plain float lists (instead of numpy objects) keep the dump small, fast and
+# readable with yaml.safe_load; use the libyaml emitter when available.
 result_yaml = {
 	"x": {
-		"px1": x1_ctrl,
-		"py1": y1_ctrl,
-		"theta1": theta1_ctrl,
-		"px0": x0_ctrl,
-		"py0": y0_ctrl,
-		"theta0": theta0_ctrl},
+		"px1": x1_ctrl.tolist(),
+		"py1": y1_ctrl.tolist(),
+		"theta1": theta1_ctrl.tolist(),
+		"px0": x0_ctrl.tolist(),
+		"py0": y0_ctrl.tolist(),
+		"theta0": theta0_ctrl.tolist()},
 	"u": {
 		#"omega": dtheta0_ctrl,
-		"delta": delta0_ctrl,
-		"v_l": v0_ctrl},
-	"t": t_ctrl
+		"delta": delta0_ctrl.tolist(),
+		"v_l": v0_ctrl.tolist()},
+	"t": t_ctrl.tolist()
 	}
 
 with open('truck_trailer_x_u.yaml', 'w') as file:
-    yaml.dump(result_yaml, file)
+    yaml.dump(result_yaml, file, Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper),
+              default_flow_style=True)
 
 Nsim = len(t_ctrl)
 if use_simulator:
-	# -------------------------------
-	# Logging variables
-	# -------------------------------
-	theta1_sim = np.zeros(Nsim)
-	x1_sim     = np.zeros(Nsim)
-	y1_sim     = np.zeros(Nsim)
-
-	theta0_sim = np.zeros(Nsim)
-	x0_sim     = np.zeros(Nsim)
-	y0_sim     = np.zeros(Nsim)
-
 	x_current = vertcat(theta1_t0, x1_t0, y1_t0, theta0_t0)
 
 	simu = simulator_delta_init()
 
-	for k in range(Nsim-1):
-		beta01_sim = theta0_sim[k] - theta1_sim[k]
-		beta01_ctrl = theta0_ctrl[k] - theta1_ctrl[k]
-		error = beta01_ctrl - beta01_sim
-		# if error > 0.:
-		# 	print('iter:', k, '\t beta01 error:', error, '\t -correction')
-		# 	delta0_ctrl[k] = delta0_ctrl[k] - .02
-		# elif error < -0.:
-		# 	print('iter:', k, '\t beta01 error:', error, '\t +correction')
-		# 	delta0_ctrl[k] = delta0_ctrl[k] + .02
-
-		u = vertcat(delta0_ctrl[k], v0_ctrl[k])
-		dt = t_ctrl[k+1] - t_ctrl[k]
-		x_next = simulator(simu, x_current, u, dt)
-
-		theta1_sim[k+1] = x_next[0]
-		x1_sim[k+1]     = x_next[1]
-		y1_sim[k+1]     = x_next[2]
-
-		theta0_sim[k+1] = x_next[3]
-		x0_sim[k+1]     = x_next[1] + L1*cos(x_next[0]) + M0*cos(x_next[3])
-		y0_sim[k+1]     = x_next[2] + L1*sin(x_next[0]) + M0*sin(x_next[3])
-
-		x_current = x_next
+	# Simulate all control samples in a single call: one step of the
+	# simulator, extended with the truck position, is accumulated over the
+	# whole horizon
+	x  = c.SX.sym('x', 4)
+	u  = c.SX.sym('u', 2)
+	dt = c.SX.sym('dt')
+	truck_pos = c.Function('truck_pos', [x], [x[1] + L1*c.cos(x[0]) + M0*c.cos(x[3]),
+											  x[2] + L1*c.sin(x[0]) + M0*c.sin(x[3])])
+	x_next = simulator(simu, x, u, dt)
+	f_step = c.Function('f_step', [x, u, dt], [x_next, *truck_pos(x_next)])
+	f_rollout = f_step.mapaccum(Nsim-1)
+
+	x_sim, x0_sim, y0_sim = f_rollout(x_current, np.vstack((delta0_ctrl[:-1], v0_ctrl[:-1])), np.diff(t_ctrl))
+
+	# Logging variables, starting from the initial state
+	theta1_sim, x1_sim, y1_sim, theta0_sim = horzcat(x_current, x_sim).full()
+	x0_sim = horzcat(truck_pos(x_current)[0], x0_sim).full()[0]
+	y0_sim = horzcat(truck_pos(x_current)[1], y0_sim).full()[0]
 
 if show_figures:
 	# Show results
 	from pylab import *
 
-	plt.figure(1)
+	fig1 = plt.figure(1)
 	ax1 = plt.subplot(1, 1, 1)
 	ax1.axis('equal')
 
@@ -317,10 +442,17 @@ if show_figures:
 	ax1.plot(x1_2sol[0], y1_2sol[0],'kx')
 	ax1.plot(x1_2sol[-1], y1_2sol[-1],'kx')
 
-	draw_constraint(w1_1.full().T[0], ax1, 'red')
-	draw_constraint(w2_1.full().T[0], ax1, 'red')
-	draw_constraint(w1_2.full().T[0], ax1, 'red')
-	draw_constraint(w2_2.full().T[0], ax1, 'red')
+	draw_constraint(w1_1, ax1, 'red')
+	draw_constraint(w2_1, ax1, 'red')
+	draw_constraint(w1_2, ax1, 'red')
+	draw_constraint(w2_2, ax1, 'red')
+
+	# Moving artists are updated in place, so include the vehicle outlines of
+	# all frames in the axis limits up front.
+	for k in range(Nsim-1):
+		ax1.update_datalim(np.column_stack(vehic_xy(x0_ctrl[k], y0_ctrl[k], theta0_ctrl[k], W0/2, W0/2,    L0, M0)))
+		ax1.update_datalim(np.column_stack(vehic_xy(x1_ctrl[k], y1_ctrl[k], theta1_ctrl[k], W1/2, W1/2, .8*L1, M1)))
+	ax1.autoscale_view()
 	ax1.set_ylim(-2, 4)
 
 	plt.figure(2)
@@ -329,6 +461,46 @@ if show_figures:
 	ax21.plot(t_ctrl, delta0_ctrl)
 	ax22.plot(t_ctrl, v0_ctrl)
 
+	# Create the moving artists once and only update their data per frame.
+	# Unless frames are saved (they need the artists in a full render), they
+	# are animated and blitted on top of a cached static background.
+	[truck]           = vehic_to_plot(ax1, x0_ctrl[0], y0_ctrl[0], theta0_ctrl[0], W0/2,  W0/2, L0, M0, color='grey')
+	[truck_steer]     = wheel_to_plot(ax1, x0_ctrl[0], y0_ctrl[0], theta0_ctrl[0], L0, 0, delta0_ctrl[0], color='k')
+	[truck_fixed_1]   = wheel_to_plot(ax1, x0_ctrl[0], y0_ctrl[0], theta0_ctrl[0], 0,  W0/2, 0, color='k')
+	[truck_fixed_2]   = wheel_to_plot(ax1, x0_ctrl[0], y0_ctrl[0], theta0_ctrl[0], 0, -W0/2, 0, color='k')
+	[truck_xy]        = ax1.plot(x0_ctrl[0], y0_ctrl[0], 'x', color='grey')
+	[trailer]         = vehic_to_plot(ax1, x1_ctrl[0], y1_ctrl[0], theta1_ctrl[0], W1/2,  W1/2, .8*L1, M1, color='r')
+	[trailer_fixed_1] = wheel_to_plot(ax1, x1_ctrl[0], y1_ctrl[0], theta1_ctrl[0], 0,  W1/2, 0, color='k')
+	[trailer_fixed_2] = wheel_to_plot(ax1, x1_ctrl[0], y1_ctrl[0], theta1_ctrl[0], 0, -W1/2, 0, color='k')
+	[trailer_xy]      = ax1.plot(x1_ctrl[0], y1_ctrl[0], 'x', color='r')
+	[coupling_xy]     = ax1.plot([], [], '-', color='k')
+	[coupling_dot]    = ax1.plot([], [], 'o', color='k')
+	vehicle_artists = [truck, truck_steer, truck_fixed_1, truck_fixed_2, truck_xy,
+					   trailer, trailer_fixed_1, trailer_fixed_2, trailer_xy,
+					   coupling_xy, coupling_dot]
+	artists = list(vehicle_artists)
+	if use_simulator:
+		# Simulated positions leave a trail of all frames drawn so far
+		[truck_xy_sim]   = ax1.plot([], [], '.', color='darkgrey')
+		[trailer_xy_sim] = ax1.plot([], [], '.', color='darkred')
+		artists += [truck_xy_sim, trailer_xy_sim]
+
+	for artist in artists:
+		artist.set_animated(not save_for_gif)
+
+	if save_for_gif:
+		# Frames are rendered in the loop, their PNG encoding runs meanwhile
+		png_writer = ThreadPoolExecutor(max_workers=4)
+		png_writes = []
+	else:
+		background = None
+		def grab_background(event):
+			global background
+			background = fig1.canvas.copy_from_bbox(fig1.bbox)
+		fig1.canvas.mpl_connect('draw_event', grab_background)
+	plt.show(block=False)
+	fig1.canvas.draw()
+
 	for k in range(Nsim-1):
 		x0s     = x0_ctrl[k]
 		y0s     = y0_ctrl[k]
@@ -338,42 +510,52 @@ if show_figures:
 		theta1s = theta1_ctrl[k]
 		delta0s = delta0_ctrl[k]
 
-		truck           = vehic_to_plot(ax1, x0s, y0s, theta0s, W0/2,  W0/2,      L0, M0, color='grey')
-		truck_steer     = wheel_to_plot(ax1, x0s, y0s, theta0s,   L0,     0, delta0s,     color='k')
-		truck_fixed_1   = wheel_to_plot(ax1, x0s, y0s, theta0s,    0,  W0/2,       0,     color='k')
-		truck_fixed_2   = wheel_to_plot(ax1, x0s, y0s, theta0s,    0, -W0/2,       0,     color='k')
-		truck_xy        = ax1.plot(x0s, y0s, 'x', color='grey')
+		truck.set_data(*vehic_xy(x0s, y0s, theta0s, W0/2,  W0/2,      L0, M0))
+		truck_steer.set_data(*wheel_xy(x0s, y0s, theta0s,   L0,     0, delta0s))
+		truck_fixed_1.set_data(*wheel_xy(x0s, y0s, theta0s,    0,  W0/2,       0))
+		truck_fixed_2.set_data(*wheel_xy(x0s, y0s, theta0s,    0, -W0/2,       0))
+		truck_xy.set_data([x0s], [y0s])
 		if use_simulator:
-			truck_xy_sim = ax1.plot(x0_sim[k], y0_sim[k], '.', color='darkgrey')
+			truck_xy_sim.set_data(x0_sim[:k+1], y0_sim[:k+1])
 
-		trailer         = vehic_to_plot(ax1, x1s, y1s, theta1s, W1/2,  W1/2,   .8*L1, M1, color='r')
-		trailer_fixed_1 = wheel_to_plot(ax1, x1s, y1s, theta1s,    0,  W1/2,       0,     color='k')
-		trailer_fixed_2 = wheel_to_plot(ax1, x1s, y1s, theta1s,    0, -W1/2,       0,     color='k')
-		trailer_xy      = ax1.plot(x1s, y1s, 'x', color='r')
+		trailer.set_data(*vehic_xy(x1s, y1s, theta1s, W1/2,  W1/2,   .8*L1, M1))
+		trailer_fixed_1.set_data(*wheel_xy(x1s, y1s, theta1s,    0,  W1/2,       0))
+		trailer_fixed_2.set_data(*wheel_xy(x1s, y1s, theta1s,    0, -W1/2,       0))
+		trailer_xy.set_data([x1s], [y1s])
 		if use_simulator:
-			trailer_xy_sim = ax1.plot(x1_sim[k], y1_sim[k], '.', color='darkred')
+			trailer_xy_sim.set_data(x1_sim[:k+1], y1_sim[:k+1])
 
-		coupling     = vert_single(x0s, y0s, theta0s, -M0, 0)
-		coupling_xy  = ax1.plot([x1s, coupling[0][0]], [y1s, coupling[0][1]], '-', color='k')
-		coupling_dot = ax1.plot(coupling[0][0], coupling[0][1], 'o', color='k')	
+		coupling = vert_single(x0s, y0s, theta0s, -M0, 0)
+		coupling_xy.set_data([x1s, coupling[0][0]], [y1s, coupling[0][1]])
+		coupling_dot.set_data([coupling[0][0]], [coupling[0][1]])
 
 		if save_for_gif:
 			png_name = 'trailer'+str(k)+'.png'
-			plt.savefig(png_name)
-
-		pause(.001)
-		if k < Nsim-1:
-			truck.pop(0).remove()
-			truck_steer.pop(0).remove()
-			truck_fixed_1.pop(0).remove()
-			truck_fixed_2.pop(0).remove()
-			truck_xy.pop(0).remove()
-			trailer.pop(0).remove()
-			trailer_fixed_1.pop(0).remove()
-			trailer_fixed_2.pop(0).remove()
-			trailer_xy.pop(0).remove()
-			coupling_xy.pop(0).remove()
-			coupling_dot.pop(0).remove()
+			fig1.canvas.draw()
+			frame = np.asarray(fig1.canvas.buffer_rgba()).copy()
+			png_writes.append(png_writer.submit(plt.imsave, png_name, frame))
+			# Bound the number of frame copies waiting to be written, and
+			# raise errors of the writes
+			if len(png_writes) > 8:
+				png_writes.pop(0).result()
+			fig1.canvas.flush_events()
+		else:
+			fig1.canvas.restore_region(background)
+			for artist in artists:
+				ax1.draw_artist(artist)
+			fig1.canvas.blit(fig1.bbox)
+			fig1.canvas.flush_events()
+
+	if save_for_gif:
+		for png_write in png_writes:
+			png_write.result()
+		png_writer.shutdown(wait=True)
+
+	# Only the simulated trail stays in the final figure
+	for artist in vehicle_artists:
+		artist.remove()
+	for artist in artists:
+		artist.set_animated(False)
 
 	if use_simulator:
 		plt.figure(3)